@@ -0,0 +1,42 @@
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Helpers shared by the CLI scripts and the API
+
+# Shared HTTP session so repeated Google Maps calls reuse keep-alive connections
+def create_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Invariant part of the review prompt, built once; only the reviewer and
+# review text are appended per call
+REVIEW_PROMPT_PREFIX = (
+    "Rate this Google review. JSON keys: sentiment(positive|negative|neutral),"
+    "specificity(high|medium|low),authenticity_score(1-5),category(Fake|Not Fake),"
+    "recommendation(Go|Avoid),summary.\n"
+)
+
+# Verdict for reviews too short to say anything about, returned without a model call.
+# A review must be short in both words and characters: scripts such as Japanese,
+# Chinese or Thai don't separate words with spaces, so a word count alone would
+# flag whole sentences.
+MIN_REVIEW_WORDS = 3
+MIN_REVIEW_CHARS = 10
+SHORT_REVIEW_ANALYSIS = orjson.dumps({
+    "category": "Fake",
+    "authenticity_score": 2,
+    "summary": "Too short to assess"
+}).decode()
+
+def is_too_short(review_text: str) -> bool:
+    """Check whether a review is too short to be worth a model call"""
+    return len(review_text.split()) < MIN_REVIEW_WORDS and len(review_text.strip()) < MIN_REVIEW_CHARS
@@ -1,10 +1,12 @@
 import os
-import re
+import functools
 import requests
-import json
+import orjson
 import time
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from langchain_community.llms import Ollama
+from common import REVIEW_PROMPT_PREFIX, SHORT_REVIEW_ANALYSIS, create_session, is_too_short
+from url_utils import PLACE_ID_RE, PLACE_NAME_RE
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,49 +14,71 @@ load_dotenv()
 # --- Configuration ---
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
-# ✅ Initialize Ollama LLM
-llm = Ollama(model="gemma2:2b", base_url="http://localhost:11434")
+# 4-bit Q4_K_M Gemma build (`ollama pull gemma2:2b-instruct-q4_K_M`); its smaller
+# weights cut memory traffic per generated token. Override with OLLAMA_MODEL.
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma2:2b-instruct-q4_K_M")
 
-# --- Geocoding and Place Details Functions ---
+OLLAMA_URL = "http://localhost:11434/api/generate"
 
-def get_place_id_from_url(url, api_key):
-    print(f"Processing URL: {url}")
+# Shared HTTP session so repeated Google Maps calls reuse keep-alive connections
+SESSION = create_session()
+
+# Place details keyed by place_id, so re-analyzing a place doesn't re-hit the Places API
+DETAILS_CACHE = TTLCache(maxsize=2048, ttl=600)
 
+# --- Geocoding and Place Details Functions ---
+
+# Re-submitted URLs skip the redirect and Find Place calls. Failures raise
+# LookupError instead of returning None so they are not cached.
+@functools.lru_cache(maxsize=4096)
+def _url_to_place_id(url, api_key):
     # Follow redirects for short URLs
     if any(shortener in url for shortener in ["goo.gl", "maps.app.goo.gl"]):
         try:
-            response = requests.get(url, allow_redirects=True, timeout=10)
+            # HEAD follows the redirect chain without downloading the page body
+            response = SESSION.head(url, allow_redirects=True, timeout=5)
+            if response.status_code in (405, 501):
+                response = SESSION.get(url, allow_redirects=True, timeout=10)
             url = response.url
             print(f"Redirected URL: {url}")
         except requests.exceptions.RequestException as e:
-            print(f"Redirect error: {e}")
-            return None
+            raise LookupError(f"Redirect error: {e}")
 
     # If URL has place_id param, use it directly
-    pid_match = re.search(r'place_id=([^&]+)', url)
+    pid_match = PLACE_ID_RE.search(url)
     if pid_match:
         return pid_match.group(1)
 
     # Try finding Place ID using the full place name from the URL
-    name_match = re.search(r'/place/([^/@]+)', url)
+    name_match = PLACE_NAME_RE.search(url)
     if name_match:
         place_name = name_match.group(1).replace('+', ' ')
         find_url = (
             f"https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
             f"?input={place_name}&inputtype=textquery&fields=place_id&key={api_key}"
         )
-        resp = requests.get(find_url)
+        resp = SESSION.get(find_url, timeout=10)
         data = resp.json()
         if data.get("status") == "OK" and data["candidates"]:
             return data["candidates"][0]["place_id"]
 
-    print("Could not extract Place ID.")
-    return None
+    raise LookupError("Could not extract Place ID.")
+
+def get_place_id_from_url(url, api_key):
+    print(f"Processing URL: {url}")
+    try:
+        return _url_to_place_id(url, api_key)
+    except LookupError as e:
+        print(e)
+        return None
 
 
 
 
 def fetch_place_details(place_id, api_key):
+    if place_id in DETAILS_CACHE:
+        return DETAILS_CACHE[place_id]
+
     fields = [
         "name", "formatted_address", "rating", "user_ratings_total",
         "price_level", "opening_hours", "website", "formatted_phone_number",
@@ -65,13 +89,15 @@ def fetch_place_details(place_id, api_key):
     details_url = f"https://maps.googleapis.com/maps/api/place/details/json?place_id={place_id}&fields={fields_str}&key={api_key}"
 
     try:
-        response = requests.get(details_url)
+        response = SESSION.get(details_url, timeout=10)
         response.raise_for_status()
         details_data = response.json()
 
         if details_data.get('status') == 'OK':
             print("Successfully fetched place details.")
-            return details_data.get('result', {})
+            result = details_data.get('result', {})
+            DETAILS_CACHE[place_id] = result
+            return result
         else:
             print("Places Details API failed to return results.")
             print(f"API Response: {details_data}")
@@ -82,33 +108,56 @@ def fetch_place_details(place_id, api_key):
 
 # --- Ollama Review Analysis Function ---
 
+def ollama_generate(prompt):
+    response = SESSION.post(
+        OLLAMA_URL,
+        json={
+            "model": OLLAMA_MODEL,
+            "prompt": prompt,
+            "stream": False,
+            # JSON mode makes the model emit parseable output instead of prose
+            "format": "json",
+            "options": {"num_ctx": 1024, "num_predict": 160, "num_thread": os.cpu_count()}
+        },
+        timeout=120
+    )
+    response.raise_for_status()
+    return response.json()["response"]
+
+class UnparsedAnalysis(Exception):
+    """Model output that isn't a JSON object, e.g. cut off at num_predict"""
+    def __init__(self, raw_output):
+        super().__init__(raw_output)
+        self.raw_output = raw_output
+
+# Identical (template/spam) reviews are common, so memoize the model output.
+# Exceptions are not cached, so a failed call or an unparseable answer is
+# retried next time.
+@functools.lru_cache(maxsize=4096)
+def _analyze_cached(review_text, reviewer_name):
+    prompt = REVIEW_PROMPT_PREFIX + f"Reviewer:{reviewer_name}\nReview:{review_text}"
+    analysis = ollama_generate(prompt)
+    try:
+        parsed = orjson.loads(analysis)
+    except orjson.JSONDecodeError:
+        raise UnparsedAnalysis(analysis)
+    if not isinstance(parsed, dict):
+        raise UnparsedAnalysis(analysis)
+    return analysis
+
 def analyze_review(review_text, reviewer_name="Anonymous"):
-    prompt = f"""
-    Analyze the following review text for sentiment, specificity, and potential signs of being fake. 
- Provide a score from 1-10 for authenticity, where 1 is highly suspicious and 10 is very authentic.
- 
- Reviewer: "{reviewer_name}"
- Review: "{review_text}"
- 
- Instructions: Your analysis should be based on linguistic patterns, specificity of details, and sentiment coherence.
- Please provide your analysis in the following JSON format:
- 
- {{
-     "reviewer": "{reviewer_name}",
-     "sentiment": "[positive|negative|neutral]",
-     "specificity": "[high|medium|low]",
-     "authenticity_score": [0-5],
-     "category": "**Fake**" or "**Not Fake**", 
-     "recommendation": "**Go**" or "**Avoid**",
-     "summary": "[brief explanation]"
- }}
-    """
+    if is_too_short(review_text):
+        return SHORT_REVIEW_ANALYSIS
+
+    # Collapse whitespace so reviews differing only in spacing share a cache entry
+    review_text = " ".join(review_text.split())
     try:
-        response = llm.invoke(prompt)
-        return response
+        return _analyze_cached(review_text, reviewer_name)
+    except UnparsedAnalysis as e:
+        return e.raw_output
     except Exception as e:
         print(f"Error analyzing review with Ollama: {e}")
-        return json.dumps({"error": str(e)})
+        return orjson.dumps({"error": str(e)}).decode()
 
 # --- Main Logic ---
 
@@ -148,17 +197,17 @@ if __name__ == "__main__":
                     print(f"Analyzing Review {i}...")
                     analysis = analyze_review(review_text)
                     try:
-                        parsed_analysis = json.loads(analysis)
-                    except:
+                        parsed_analysis = orjson.loads(analysis)
+                    except orjson.JSONDecodeError:
                         parsed_analysis = {"raw_output": analysis}
 
-                    output['reviews_analysis'].append({
-                        "original_review": review_text,
-                        **parsed_analysis
-                    })
+                    # parsed_analysis is a fresh dict, so tag it in place rather
+                    # than copying it into a merged one
+                    parsed_analysis["original_review"] = review_text
+                    output['reviews_analysis'].append(parsed_analysis)
 
             print("\n✅ Final Structured JSON Output:\n")
-            print(json.dumps(output, indent=2, ensure_ascii=False))
+            print(orjson.dumps(output, option=orjson.OPT_INDENT_2).decode())
 
         except Exception as e:
             print(f"❌ Error: {e}")
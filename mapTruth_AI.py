@@ -1,24 +1,43 @@
 from dotenv import load_dotenv
 import os
+import functools
 import googlemaps
-import re
-import requests
-from langchain.llms import Ollama
+from cachetools import TTLCache
+from common import create_session
+from url_utils import PLACE_ID_PATTERNS, POTENTIAL_PLACE_ID_RE
 
 # Load environment variables from .env
 load_dotenv()
 
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
-# Initialize Ollama LLM
-llm = Ollama(model="gemma2:2b", base_url="http://localhost:11434")
+OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_MODEL = "gemma2:2b"
+
+# Shared HTTP session so repeated Google Maps calls reuse keep-alive connections
+SESSION = create_session()
 
 # Initialize Google Maps client
-gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
+gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY, requests_session=SESSION)
+
+# Place details keyed by place_id, so re-analyzing a place doesn't re-hit the Places API
+DETAILS_CACHE = TTLCache(maxsize=2048, ttl=600)
+
+def ollama_generate(prompt):
+    response = SESSION.post(
+        OLLAMA_URL,
+        json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": False},
+        timeout=120
+    )
+    response.raise_for_status()
+    return response.json()["response"]
 
 def expand_short_url(short_url):
     try:
-        response = requests.get(short_url, allow_redirects=True)
+        # HEAD follows the redirect chain without downloading the page body
+        response = SESSION.head(short_url, allow_redirects=True, timeout=5)
+        if response.status_code in (405, 501):
+            response = SESSION.get(short_url, allow_redirects=True, timeout=10)
         final_url = response.url
         print("Expanded URL:", final_url)
         return final_url
@@ -27,6 +46,8 @@ def expand_short_url(short_url):
         return None
 
 # extract the place_id from the Google Maps URL
+# (cached so a re-submitted URL skips the redirect; failures raise and aren't cached)
+@functools.lru_cache(maxsize=4096)
 def extract_place_id(google_maps_url):
     print(f"Processing URL: {google_maps_url}")
 
@@ -40,25 +61,14 @@ def extract_place_id(google_maps_url):
             raise ValueError("Failed to expand short URL")
 
     # Try different patterns for Google Maps URLs
-    patterns = [
-        r"place_id=([^&]+)",
-        r"maps\.google\.com/maps/place/[^/]+/([^/?]+)",
-        r"maps\.google\.com/maps/place/[^/]+/@([^/?]+)",
-        r"maps\.google\.com/maps/place/[^/]+/data=([^/?]+)",
-        r"maps\.google\.com/maps/place/[^/]+/@[^/]+/([^/?]+)",
-        r"maps\.google\.com/maps/place/[^/]+/@[^/]+/[^/]+/([^/?]+)",
-        r"maps\.google\.com/maps/place/[^/]+/@[^/]+/[^/]+/[^/]+/([^/?]+)",
-        r"maps\.google\.com/maps/place/[^/]+/@[^/]+/[^/]+/[^/]+/[^/]+/([^/?]+)"
-    ]
-
-    for i, pattern in enumerate(patterns):
-        match = re.search(pattern, google_maps_url)
+    for i, pattern in enumerate(PLACE_ID_PATTERNS):
+        match = pattern.search(google_maps_url)
         if match:
             place_id = match.group(1)
             print(f"Found place_id using pattern {i+1}: {place_id}")
             return place_id
 
-    potential_place_id = re.search(r'([A-Za-z0-9_-]{20,})', google_maps_url)
+    potential_place_id = POTENTIAL_PLACE_ID_RE.search(google_maps_url)
     if potential_place_id:
         print(f"Found potential place_id: {potential_place_id.group(1)}")
         return potential_place_id.group(1)
@@ -70,30 +80,45 @@ def extract_place_id(google_maps_url):
 
 # fetch place details from Google Maps API
 def fetch_place_details(place_id):
+    if place_id in DETAILS_CACHE:
+        return DETAILS_CACHE[place_id]
+
     fields = ["name", "formatted_address", "rating", "user_ratings_total", "price_level", "opening_hours", "website", "formatted_phone_number", "photos", "reviews"]
     place = gmaps.place(place_id=place_id, fields=fields)
-    return place.get('result', {})
+    result = place.get('result', {})
+    DETAILS_CACHE[place_id] = result
+    return result
 
 # summarize location using Ollama
 def summarize_place(details):
+    # Only pass the fields worth summarizing. Raw photo entries carry long
+    # photo_reference IDs and opening_hours repeats itself in periods, both of
+    # which inflate the prompt without adding meaning.
+    core = {k: details.get(k, 'N/A') for k in [
+        "name", "formatted_address", "rating", "user_ratings_total",
+        "price_level", "website", "formatted_phone_number"
+    ]}
+    hours = details.get('opening_hours', {}).get('weekday_text')
+    core["hours"] = "; ".join(hours) if hours else 'N/A'
+    core["photo_count"] = len(details.get('photos', []))
+
     prompt = f"""
     You are a helpful assistant that summarizes location details.
 
-    Name: {details.get('name', 'N/A')}
-    Address: {details.get('formatted_address', 'N/A')}
-    Rating: {details.get('rating', 'N/A')}
-    Total Ratings: {details.get('user_ratings_total', 'N/A')}
-    Price Level: {details.get('price_level', 'N/A')}
-    Opening Hours: {details.get('opening_hours', 'N/A')}
-    Website: {details.get('website', 'N/A')}
-    Phone Number: {details.get('formatted_phone_number', 'N/A')}
-    Photos: {details.get('photos', 'N/A')}
+    Name: {core['name']}
+    Address: {core['formatted_address']}
+    Rating: {core['rating']}
+    Total Ratings: {core['user_ratings_total']}
+    Price Level: {core['price_level']}
+    Opening Hours: {core['hours']}
+    Website: {core['website']}
+    Phone Number: {core['formatted_phone_number']}
+    Photos: {core['photo_count']}
 
     Please provide a concise summary of this location.
     """
 
-    response = llm.invoke(prompt)
-    return response
+    return ollama_generate(prompt)
 
 # extract reviews into an array
 def extract_reviews(details):
@@ -1,14 +1,19 @@
 import os
-import re
+import asyncio
+import hashlib
 import requests
-import json
+import httpx
+from cachetools import LRUCache, TTLCache
+import orjson
 import time
 from dotenv import load_dotenv
-from langchain_community.llms import Ollama
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
+from common import REVIEW_PROMPT_PREFIX, SHORT_REVIEW_ANALYSIS, create_session, is_too_short
+from url_utils import PLACE_ID_RE, PLACE_NAME_RE
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,8 +21,38 @@ load_dotenv()
 # Configuration
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
-# Initialize Ollama LLM
-llm = Ollama(model="gemma2:2b", base_url="http://localhost:11434", temperature=0.2)
+# Ollama generate endpoint. Reviews are analyzed concurrently, so start the
+# server with OLLAMA_NUM_PARALLEL >= number of reviews (Places returns up to 5)
+# or the extra requests will queue on the Ollama side. On a GPU host,
+# OLLAMA_NUM_PARALLEL=8 OLLAMA_KEEP_ALIVE=1h keeps the model loaded.
+OLLAMA_URL = "http://localhost:11434/api/generate"
+
+# Generation slots on the Ollama server (the same OLLAMA_NUM_PARALLEL it reads).
+# Each process caps its own in-flight generations at OLLAMA_SLOTS_PER_WORKER,
+# which defaults to the full server budget; with several workers, lower it to
+# keep less work queued on the Ollama side, which holds the overflow anyway.
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+OLLAMA_SLOTS_PER_WORKER = int(os.getenv("OLLAMA_SLOTS_PER_WORKER", str(OLLAMA_NUM_PARALLEL)))
+
+# 4-bit Q4_K_M Gemma build (`ollama pull gemma2:2b-instruct-q4_K_M`); its smaller
+# weights cut memory traffic per generated token. Override with OLLAMA_MODEL.
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma2:2b-instruct-q4_K_M")
+
+# Raw model output keyed by (review text, reviewer). Identical template/spam
+# reviews are common and each costs seconds of inference.
+REVIEW_CACHE = LRUCache(maxsize=4096)
+
+# Google lookups keyed by place_id / original URL. URL mappings expire after an
+# hour so a reposted short link doesn't keep resolving to its old place.
+DETAILS_CACHE = TTLCache(maxsize=2048, ttl=600)
+PLACE_ID_CACHE = TTLCache(maxsize=4096, ttl=3600)
+
+# In-flight fetch locks per cache key, so concurrent requests for the same cold
+# key wait on one Google call instead of all firing their own. Each entry is
+# [lock, number of callers holding or waiting on it]; it is removed when the
+# last of them finishes.
+DETAILS_LOCKS: Dict[str, List[Any]] = {}
+PLACE_ID_LOCKS: Dict[str, List[Any]] = {}
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -26,6 +61,20 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Shared HTTP session so repeated Google Maps calls reuse keep-alive connections;
+# created on startup and kept on app.state for the lifetime of the app
+@app.on_event("startup")
+async def startup():
+    app.state.session = create_session()
+    # One keep-alive client to Ollama shared by all requests
+    app.state.http = httpx.AsyncClient(timeout=120)
+    app.state.ollama_slots = asyncio.Semaphore(OLLAMA_SLOTS_PER_WORKER)
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.session.close()
+    await app.state.http.aclose()
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -54,7 +103,13 @@ class ReviewAnalysis(BaseModel):
     recommendation: str
     summary: str
     original_review: str
+    # Unparsed model output, set only when the analysis fell back to defaults
+    raw_output: Optional[str] = None
 
+# /analyze streams NDJSON rather than returning this model directly: a
+# {"place_details": ...} line, one {"review_analysis": ...} line per review
+# as it completes, then a closing {"success": ..., "message": ...} line.
+# Collected together the lines carry the same fields as AnalysisResponse.
 class AnalysisResponse(BaseModel):
     place_details: PlaceDetails
     reviews_analysis: List[ReviewAnalysis]
@@ -66,42 +121,96 @@ class ErrorResponse(BaseModel):
     error: str
 
 # Core functions
-def get_place_id_from_url(url: str, api_key: str) -> Optional[str]:
+def is_short_url(url: str) -> bool:
+    """Check whether a URL is a Google Maps short link that needs expanding"""
+    return any(shortener in url for shortener in ["goo.gl", "maps.app.goo.gl"])
+
+def expand_short_url(url: str, session: requests.Session) -> Optional[str]:
+    """Follow redirects for a short URL and return the final URL"""
+    try:
+        # HEAD follows the redirect chain without downloading the page body
+        response = session.head(url, allow_redirects=True, timeout=5)
+        if response.status_code in (405, 501):
+            response = session.get(url, allow_redirects=True, timeout=10)
+        print(f"Redirected URL: {response.url}")
+        return response.url
+    except requests.exceptions.RequestException as e:
+        print(f"Redirect error: {e}")
+        return None
+
+def find_place_id(place_name: str, api_key: str, session: requests.Session) -> Optional[str]:
+    """Look up a place_id by name with the Find Place API"""
+    find_url = (
+        f"https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
+        f"?input={place_name}&inputtype=textquery&fields=place_id&key={api_key}"
+    )
+    resp = session.get(find_url, timeout=10)
+    data = resp.json()
+    if data.get("status") == "OK" and data["candidates"]:
+        return data["candidates"][0]["place_id"]
+    return None
+
+def get_place_id_from_url(url: str, api_key: str, session: requests.Session) -> Optional[str]:
     """Extract place_id from Google Maps URL"""
     print(f"Processing URL: {url}")
     
     # Follow redirects for short URLs
-    if any(shortener in url for shortener in ["goo.gl", "maps.app.goo.gl"]):
-        try:
-            response = requests.get(url, allow_redirects=True, timeout=10)
-            url = response.url
-            print(f"Redirected URL: {url}")
-        except requests.exceptions.RequestException as e:
-            print(f"Redirect error: {e}")
+    if is_short_url(url):
+        url = expand_short_url(url, session)
+        if not url:
             return None
 
     # If URL has place_id param, use it directly
-    pid_match = re.search(r'place_id=([^&]+)', url)
+    pid_match = PLACE_ID_RE.search(url)
     if pid_match:
         return pid_match.group(1)
 
     # Try finding Place ID using the full place name from the URL
-    name_match = re.search(r'/place/([^/@]+)', url)
+    name_match = PLACE_NAME_RE.search(url)
     if name_match:
-        place_name = name_match.group(1).replace('+', ' ')
-        find_url = (
-            f"https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
-            f"?input={place_name}&inputtype=textquery&fields=place_id&key={api_key}"
-        )
-        resp = requests.get(find_url)
-        data = resp.json()
-        if data.get("status") == "OK" and data["candidates"]:
-            return data["candidates"][0]["place_id"]
+        place_id = find_place_id(name_match.group(1).replace('+', ' '), api_key, session)
+        if place_id:
+            return place_id
 
     print("Could not extract Place ID.")
     return None
 
-def fetch_place_details(place_id: str, api_key: str) -> Optional[Dict[str, Any]]:
+async def resolve_place_id(url: str, api_key: str, session: requests.Session) -> Optional[str]:
+    """Resolve a Google Maps URL to a place_id without blocking the event loop"""
+    name_match = PLACE_NAME_RE.search(url)
+    if not is_short_url(url) or not name_match:
+        return await asyncio.to_thread(get_place_id_from_url, url, api_key, session)
+
+    # The short link already names the place, so start that name lookup while
+    # the redirect chain is still resolving. An exact place_id in the expanded
+    # URL always wins; the speculative lookup is only used when there isn't one
+    # and a name lookup would be needed anyway.
+    print(f"Processing URL: {url}")
+    redirect = asyncio.create_task(asyncio.to_thread(expand_short_url, url, session))
+    speculative = asyncio.create_task(
+        asyncio.to_thread(find_place_id, name_match.group(1).replace('+', ' '), api_key, session)
+    )
+
+    expanded = await redirect
+    if not expanded:
+        speculative.cancel()
+        return None
+
+    pid_match = PLACE_ID_RE.search(expanded)
+    if pid_match:
+        speculative.cancel()
+        return pid_match.group(1)
+
+    try:
+        place_id = await speculative
+    except Exception as e:
+        print(f"Speculative place lookup failed: {e}")
+        place_id = None
+    if place_id:
+        return place_id
+    return await asyncio.to_thread(get_place_id_from_url, expanded, api_key, session)
+
+def fetch_place_details(place_id: str, api_key: str, session: requests.Session) -> Optional[Dict[str, Any]]:
     """Fetch place details from Google Places API"""
     fields = [
         "name", "formatted_address", "rating", "user_ratings_total",
@@ -113,7 +222,7 @@ def fetch_place_details(place_id: str, api_key: str) -> Optional[Dict[str, Any]]
     details_url = f"https://maps.googleapis.com/maps/api/place/details/json?place_id={place_id}&fields={fields_str}&key={api_key}"
 
     try:
-        response = requests.get(details_url)
+        response = session.get(details_url, timeout=10)
         response.raise_for_status()
         details_data = response.json()
 
@@ -128,35 +237,158 @@ def fetch_place_details(place_id: str, api_key: str) -> Optional[Dict[str, Any]]
         print(f"Error calling Places Details API: {e}")
         return None
 
-def analyze_review(review_text: str, reviewer_name: str = "Anonymous") -> str:
-    """Analyze review using Ollama"""
-    prompt = f"""You are a senior analyst specializing in Google Maps location reviews.
-
-Analyze the following review text:
-
-\"\"\"{review_text}\"\"\"
+async def cached_fetch(cache: TTLCache, locks: Dict[str, List[Any]], key: str, fetch, *args):
+    """Await fetch(*args), caching successful results"""
+    result = cache.get(key)
+    if result is not None:
+        return result
 
-Reviewer name: "{reviewer_name}"
+    entry = locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            # Another request may have filled the cache while we waited
+            result = cache.get(key)
+            if result is not None:
+                return result
+
+            result = await fetch(*args)
+            if result:
+                cache[key] = result
+            return result
+    finally:
+        # Only drop the lock once nobody else is queued on it, otherwise the
+        # next caller would get a fresh lock and fetch alongside the waiters
+        entry[1] -= 1
+        if entry[1] == 0 and locks.get(key) is entry:
+            del locks[key]
+
+async def ollama_generate(client: httpx.AsyncClient, prompt: str) -> str:
+    """Run a single non-streaming generation against Ollama"""
+    async with app.state.ollama_slots:
+        response = await client.post(
+            OLLAMA_URL,
+            json={
+                "model": OLLAMA_MODEL,
+                "prompt": prompt,
+                "stream": False,
+                # JSON mode constrains decoding to valid JSON, so no prose or code fences
+                "format": "json",
+                # Keep the model resident between batches instead of reloading it
+                "keep_alive": -1,
+                "options": {
+                    "temperature": 0.2,
+                    "num_ctx": 1024,
+                    "num_predict": 160,
+                    "num_thread": os.cpu_count()
+                }
+            }
+        )
+        response.raise_for_status()
+        return response.json()["response"]
 
-Return the analysis **strictly as JSON** in this format:
-{{
-  "reviewer": "{reviewer_name}",
-  "sentiment": "positive|negative|neutral",
-  "specificity": "high|medium|low",
-  "authenticity_score": 1-5,
-  "category": "Fake" or "Not Fake",
-  "recommendation": "Go" or "Avoid",
-  "summary": "brief explanation"
-}}
+async def analyze_review_async(client: httpx.AsyncClient, review_text: str, reviewer_name: str = "Anonymous") -> str:
+    """Analyze review using Ollama"""
+    # Collapse whitespace so reviews differing only in spacing share a cache entry
+    review_text = " ".join(review_text.split())
+    cache_key = (review_text, reviewer_name)
+    if cache_key in REVIEW_CACHE:
+        return REVIEW_CACHE[cache_key]
 
-Only output valid JSON, no extra commentary.
-"""
+    prompt = REVIEW_PROMPT_PREFIX + f"Reviewer:{reviewer_name}\nReview:{review_text}"
     try:
-        response = llm.invoke(prompt)
-        return response.strip()
+        analysis = (await ollama_generate(client, prompt)).strip()
     except Exception as e:
         print(f"Error analyzing review with Ollama: {e}")
-        return json.dumps({"error": str(e)})
+        return orjson.dumps({"error": str(e)}).decode()
+
+    # Only keep answers that validate; a truncated or mistyped one should be retried next time
+    try:
+        build_review_analysis(analysis, review_text, reviewer_name)
+    except ValueError:
+        return analysis
+    REVIEW_CACHE[cache_key] = analysis
+    return analysis
+
+def prepare_reviews(reviews: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Pull (text, reviewer name) out of Places reviews in one pass, dropping empty ones"""
+    return [
+        (text, review.get('author_name', 'Anonymous'))
+        for review in reviews
+        if (text := review.get('text', '')).strip()
+    ]
+
+def review_fingerprint(review_text: str) -> bytes:
+    """Hash a review with case and whitespace normalized, for spotting duplicates"""
+    normalized = " ".join(review_text.lower().split())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+async def analyze_reviews_batch(client: httpx.AsyncClient, reviews: List[Tuple[str, str]]) -> AsyncIterator[ReviewAnalysis]:
+    """Analyze a batch of reviews concurrently, yielding each result as it completes"""
+    # Ollama's /api/generate takes a single prompt, so the batch is sent as
+    # concurrent requests over the shared keep-alive client and the server
+    # schedules them together (up to OLLAMA_NUM_PARALLEL)
+    async def analyze_unique(review_text: str, reviewer_name: str) -> str:
+        if is_too_short(review_text):
+            return SHORT_REVIEW_ANALYSIS
+        return await analyze_review_async(client, review_text, reviewer_name)
+
+    async def analyze_one(review_text: str, reviewer_name: str, analysis_task: asyncio.Task) -> ReviewAnalysis:
+        analysis = await analysis_task
+        return parse_review_analysis(analysis, review_text, reviewer_name)
+
+    # Duplicate reviews (common with spam) share one model call
+    unique_tasks: Dict[bytes, asyncio.Task] = {}
+    tasks = []
+    for review_text, reviewer_name in reviews:
+        fingerprint = review_fingerprint(review_text)
+        if fingerprint not in unique_tasks:
+            unique_tasks[fingerprint] = asyncio.create_task(analyze_unique(review_text, reviewer_name))
+        tasks.append(asyncio.create_task(analyze_one(review_text, reviewer_name, unique_tasks[fingerprint])))
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Don't leave analyses running if the client went away mid-stream
+        for task in [*tasks, *unique_tasks.values()]:
+            task.cancel()
+
+def build_review_analysis(analysis: str, review_text: str, reviewer_name: str) -> ReviewAnalysis:
+    """Turn raw Ollama output into a ReviewAnalysis, raising ValueError if it doesn't fit"""
+    # orjson.JSONDecodeError and pydantic's ValidationError are both ValueErrors
+    parsed_analysis = orjson.loads(analysis)
+    if not isinstance(parsed_analysis, dict):
+        raise ValueError("Analysis is not a JSON object")
+
+    return ReviewAnalysis(
+        original_review=review_text,
+        reviewer=reviewer_name,
+        sentiment=parsed_analysis.get('sentiment', 'unknown'),
+        specificity=parsed_analysis.get('specificity', 'unknown'),
+        authenticity_score=parsed_analysis.get('authenticity_score', 5),
+        category=parsed_analysis.get('category', 'Unknown'),
+        recommendation=parsed_analysis.get('recommendation', 'Unknown'),
+        summary=parsed_analysis.get('summary', 'No analysis available')
+    )
+
+def parse_review_analysis(analysis: str, review_text: str, reviewer_name: str) -> ReviewAnalysis:
+    """Turn raw Ollama output into a ReviewAnalysis, falling back to defaults"""
+    try:
+        return build_review_analysis(analysis, review_text, reviewer_name)
+    except ValueError:
+        # Truncated at num_predict, not an object, or values of the wrong type
+        return ReviewAnalysis(
+            original_review=review_text,
+            reviewer=reviewer_name,
+            sentiment="unknown",
+            specificity="unknown",
+            authenticity_score=5,
+            category="Unknown",
+            recommendation="Unknown",
+            summary="Analysis failed",
+            raw_output=analysis
+        )
 
 # API Endpoints
 @app.get("/")
@@ -167,11 +399,16 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "ollama_connected": True}
-
-@app.post("/analyze", response_model=AnalysisResponse)
+    return {
+        "status": "healthy",
+        "ollama_connected": True,
+        "ollama_num_parallel": OLLAMA_NUM_PARALLEL,
+        "ollama_slots_per_worker": OLLAMA_SLOTS_PER_WORKER
+    }
+
+@app.post("/analyze", response_class=StreamingResponse)
 async def analyze_place(request: URLRequest):
-    """Analyze a Google Maps place from URL"""
+    """Analyze a Google Maps place from URL, streaming results as NDJSON"""
     if not GOOGLE_MAPS_API_KEY:
         raise HTTPException(
             status_code=500, 
@@ -180,7 +417,10 @@ async def analyze_place(request: URLRequest):
     
     try:
         # Extract place ID
-        place_id = get_place_id_from_url(request.url, GOOGLE_MAPS_API_KEY)
+        place_id = await cached_fetch(
+            PLACE_ID_CACHE, PLACE_ID_LOCKS, request.url,
+            resolve_place_id, request.url, GOOGLE_MAPS_API_KEY, app.state.session
+        )
         if not place_id:
             raise HTTPException(
                 status_code=400, 
@@ -188,7 +428,10 @@ async def analyze_place(request: URLRequest):
             )
 
         # Fetch place details
-        details = fetch_place_details(place_id, GOOGLE_MAPS_API_KEY)
+        details = await cached_fetch(
+            DETAILS_CACHE, DETAILS_LOCKS, place_id,
+            asyncio.to_thread, fetch_place_details, place_id, GOOGLE_MAPS_API_KEY, app.state.session
+        )
         if not details:
             raise HTTPException(
                 status_code=400, 
@@ -203,52 +446,29 @@ async def analyze_place(request: URLRequest):
             total_reviews=details.get('user_ratings_total')
         )
 
-        reviews_analysis = []
-        reviews_data = details.get('reviews', [])
-
-        if reviews_data:
-            for i, review in enumerate(reviews_data, 1):
-                review_text = review.get('text', '')
-                if not review_text.strip():
-                    continue
-                    
-                reviewer_name = review.get('author_name', 'Anonymous')
-                analysis = analyze_review(review_text, reviewer_name)
-                
-                try:
-                    # Strip possible Markdown code block fences before parsing
-                    cleaned_analysis = re.sub(r"```(?:json)?\s*|\s*```", "", analysis).strip()
-                    parsed_analysis = json.loads(cleaned_analysis)
-                except:
-                    parsed_analysis = {
-                        "reviewer": reviewer_name,
-                        "sentiment": "unknown",
-                        "specificity": "unknown", 
-                        "authenticity_score": 5,
-                        "category": "Unknown",
-                        "recommendation": "Unknown",
-                        "summary": "Analysis failed",
-                        "raw_output": analysis
-                    }
-
-                review_analysis = ReviewAnalysis(
-                    original_review=review_text,
-                    reviewer=parsed_analysis.get('reviewer', reviewer_name),
-                    sentiment=parsed_analysis.get('sentiment', 'unknown'),
-                    specificity=parsed_analysis.get('specificity', 'unknown'),
-                    authenticity_score=parsed_analysis.get('authenticity_score', 5),
-                    category=parsed_analysis.get('category', 'Unknown'),
-                    recommendation=parsed_analysis.get('recommendation', 'Unknown'),
-                    summary=parsed_analysis.get('summary', 'No analysis available')
-                )
-                reviews_analysis.append(review_analysis)
-
-        return AnalysisResponse(
-            place_details=place_details,
-            reviews_analysis=reviews_analysis,
-            success=True,
-            message=f"Successfully analyzed {len(reviews_analysis)} reviews"
-        )
+        reviews_data = prepare_reviews(details.get('reviews', []))
+
+        async def generate():
+            yield orjson.dumps({"place_details": place_details.model_dump()}) + b"\n"
+
+            # Reviews are analyzed concurrently and each one is sent as soon as
+            # it finishes, so the client sees the first result after the fastest
+            # review rather than after all of them
+            analyzed = 0
+            try:
+                async for review_analysis in analyze_reviews_batch(app.state.http, reviews_data):
+                    yield orjson.dumps({"review_analysis": review_analysis.model_dump()}) + b"\n"
+                    analyzed += 1
+            except Exception as e:
+                yield orjson.dumps({"success": False, "error": f"Internal server error: {str(e)}"}) + b"\n"
+                return
+
+            yield orjson.dumps({
+                "success": True,
+                "message": f"Successfully analyzed {analyzed} reviews"
+            }) + b"\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
 
     except HTTPException:
         raise
@@ -260,9 +480,9 @@ async def analyze_place(request: URLRequest):
 async def analyze_review_text(review_text: str, reviewer_name: str = "Anonymous"):
     """Analyze a single review text"""
     try:
-        analysis = analyze_review(review_text, reviewer_name)
+        analysis = await analyze_review_async(app.state.http, review_text, reviewer_name)
         try:
-            parsed_analysis = json.loads(analysis)
+            parsed_analysis = orjson.loads(analysis)
             return {"success": True, "analysis": parsed_analysis}
         except:
             return {"success": False, "raw_output": analysis}
@@ -271,4 +491,17 @@ async def analyze_review_text(review_text: str, reviewer_name: str = "Anonymous"
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("mapTruth_fastapi:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    if os.getenv("RELOAD"):
+        # Development: single process that restarts on code changes
+        uvicorn.run("mapTruth_fastapi:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # Each worker is its own process with its own event loop, HTTP clients
+        # (created on startup), caches and Ollama semaphore
+        uvicorn.run(
+            "mapTruth_fastapi:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=int(os.getenv("WORKERS", "4")),
+            loop="uvloop",
+            http="httptools"
+        )
\ No newline at end of file
@@ -0,0 +1,22 @@
+import re
+
+from common import REVIEW_PROMPT_PREFIX
+from mapTruth_fastapi import ReviewAnalysis
+
+# Filled in from the review itself (or the fallback path) rather than asked of the model
+NON_MODEL_FIELDS = {"original_review", "reviewer", "raw_output"}
+
+
+def prompt_keys(prefix):
+    """Pull the key names out of the 'JSON keys: a(x|y),b,...' rubric"""
+    rubric = prefix.split("JSON keys:", 1)[1].split(".\n", 1)[0]
+    return re.findall(r"(\w+)(?:\([^)]*\))?", rubric)
+
+
+def test_prompt_keys_match_review_analysis_fields():
+    expected = set(ReviewAnalysis.model_fields) - NON_MODEL_FIELDS
+    keys = prompt_keys(REVIEW_PROMPT_PREFIX)
+
+    assert len(keys) == len(set(keys))
+    assert set(keys) == expected
+
@@ -0,0 +1,18 @@
+import re
+
+# Precompiled Google Maps URL patterns shared by the CLI scripts and the API
+
+# ?place_id=... query parameter
+PLACE_ID_RE = re.compile(r"place_id=([^&]+)")
+
+# Place name segment, e.g. /place/Some+Cafe/@...
+PLACE_NAME_RE = re.compile(r"/place/([^/@]+)")
+
+# First path segment after the place name, skipping any /@lat,lng,zoom parts
+MAPS_PLACE_PATH_RE = re.compile(r"maps\.google\.com/maps/place/[^/]+(?:/@[^/]+)*/([^/?]+)")
+
+# Anything that looks like a raw place_id token
+POTENTIAL_PLACE_ID_RE = re.compile(r"([A-Za-z0-9_-]{20,})")
+
+# Tried in order by extract_place_id
+PLACE_ID_PATTERNS = (PLACE_ID_RE, MAPS_PLACE_PATH_RE)